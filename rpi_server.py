@@ -10,23 +10,34 @@ Open http://<PI_IP>:8080 in your browser and click "Start".
 """
 
 import asyncio
-import json
+import orjson
 import os
 import logging
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from aiohttp import web
 import aiohttp_jinja2, jinja2
 
 from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
-from aiortc.contrib.media import MediaBlackhole
+from aiortc.contrib.media import MediaBlackhole, MediaRelay
+from aiortc.mediastreams import MediaStreamError
 from aiortc.rtcrtpsender import RTCRtpSender
 from av import VideoFrame
 
 import mss
-from PIL import Image, ImageDraw
+import numpy as np
+import cv2
+import xxhash
+
+from Xlib import X, XK
+from Xlib.display import Display
+from Xlib.ext import xtest
+
+try:
+    from evdev import UInput, AbsInfo, ecodes
+except ImportError:  # evdev is optional; input then goes through XTest only
+    UInput = None
 
-import subprocess
-import re
 import time
 
 logging.basicConfig(level=logging.INFO)
@@ -36,6 +47,11 @@ ROOT = os.path.dirname(__file__)
 LISTEN_HOST = "0.0.0.0"
 LISTEN_PORT = 8080
 DISPLAY_ENV = os.environ.get("DISPLAY", ":1")   # ensure you run with DISPLAY set
+CAPTURE_CPUS = {2, 3}   # cores for the capture thread (ignored where unavailable)
+CAPTURE_NICE = -5       # capture thread priority; needs CAP_SYS_NICE, else left as is
+MOVE_INTERVAL = 1 / 60   # inject mouse_move at most this often (s); newer positions replace older
+INPUT_BACKEND = "xtest"   # "xtest" (into DISPLAY) or "uinput" (kernel input stack, physical console)
+VIDEO_CODEC = ""   # codec to prefer for the screen track (e.g. "video/H264"); empty to let SDP negotiation pick
 # ----------------------------------------
 
 # aiohttp + jinja setup
@@ -43,92 +59,413 @@ app = web.Application()
 aiohttp_jinja2.setup(app, loader=jinja2.FileSystemLoader(os.path.join(ROOT, "static")))
 
 pcs = set()
+relay = MediaRelay()
+screen = None  # single ScreenTrack shared by all peers, so capture runs once
+injector = None  # InputInjector, created on first offer once DISPLAY is known
+
+# utility to inject input (XTest path)
+# one X connection per display, reused across events instead of spawning xdotool each time
+_xdisplays = {}
+
+def get_xdisplay(display=DISPLAY_ENV):
+    d = _xdisplays.get(display)
+    if d is None:
+        d = _xdisplays[display] = Display(display)
+    return d
+
+# X button numbers, shared by the XTest and uinput paths; anything else is a right click
+BUTTONS = {'left': 1, 'middle': 2, 'right': 3}
 
-# utility to inject input (xdotool path)
 def inject_mouse_abs(x, y, button='left', pressed=True, display=DISPLAY_ENV):
     try:
-        env = dict(os.environ)
-        env['DISPLAY'] = display
+        d = get_xdisplay(display)
         # move then down/up
-        subprocess.run(['xdotool', 'mousemove', '--sync', str(x), str(y)], env=env)
+        xtest.fake_input(d, X.MotionNotify, x=x, y=y)
+        btn = BUTTONS.get(button, 3)
         if pressed:
-            subprocess.run(['xdotool', 'mousedown', '1' if button=='left' else '3'], env=env)
+            xtest.fake_input(d, X.ButtonPress, btn)
         else:
-            subprocess.run(['xdotool', 'mouseup', '1' if button=='left' else '3'], env=env)
+            xtest.fake_input(d, X.ButtonRelease, btn)
+        d.flush()
     except Exception as e:
         logging.exception("inject_mouse_abs failed: %s", e)
 
+def inject_mouse_move(x, y, display=DISPLAY_ENV):
+    try:
+        d = get_xdisplay(display)
+        xtest.fake_input(d, X.MotionNotify, x=x, y=y)
+        d.flush()
+    except Exception as e:
+        logging.exception("inject_mouse_move failed: %s", e)
+
+# xdotool's shorthands for modifiers, which are not X keysym names themselves
+KEYSYM_ALIASES = {
+    'alt': 'Alt_L', 'ctrl': 'Control_L', 'control': 'Control_L',
+    'shift': 'Shift_L', 'super': 'Super_L', 'meta': 'Meta_L',
+}
+
+def resolve_key(d, key):
+    """
+    Look up an X keysym name ("a", "A", "Return"...) or one of xdotool's modifier shorthands
+    ("ctrl"...) in the live keymap, so non-US layouts come out right. Returns
+    (keycode, index), where index 1 is the keycode's shifted level, or None if unmapped.
+    """
+    key = str(key)
+    keysym = XK.string_to_keysym(KEYSYM_ALIASES.get(key.lower(), key))
+    found = sorted(d.keysym_to_keycodes(keysym), key=lambda ki: ki[1]) if keysym else []
+    return found[0] if found else None
+
 def inject_key(key, pressed=True, display=DISPLAY_ENV):
     try:
-        env = dict(os.environ)
-        env['DISPLAY'] = display
+        d = get_xdisplay(display)
+        found = resolve_key(d, key)
+        if found is None:
+            logging.warning("inject_key: unknown key %r", key)
+            return
+        keycode, index = found
         if pressed:
-            subprocess.run(['xdotool', 'keydown', str(key)], env=env)
+            # like xdotool, add Shift for keysyms that need it (e.g. "A", "exclam")
+            shift = d.keysym_to_keycode(XK.XK_Shift_L) if index == 1 else 0
+            if shift:
+                xtest.fake_input(d, X.KeyPress, shift)
+            xtest.fake_input(d, X.KeyPress, keycode)
+            if shift:
+                xtest.fake_input(d, X.KeyRelease, shift)
         else:
-            subprocess.run(['xdotool', 'keyup', str(key)], env=env)
+            xtest.fake_input(d, X.KeyRelease, keycode)
+        d.flush()
     except Exception as e:
         logging.exception("inject_key failed: %s", e)
 
+class InputInjector:
+    """
+    Injects input through the XTest helpers above, or with backend "uinput" through
+    virtual uinput devices (one absolute pointer, one keyboard), writing each event as a
+    single report with one syn().
+    uinput feeds the kernel input stack, so it only reaches an X server reading real
+    devices (the physical console), not Xvfb/Xvnc, and keys are sent as US-layout
+    scancodes. It falls back to XTest when evdev or /dev/uinput is unavailable, or for
+    keys with no evdev code.
+    """
+    # X button number (see BUTTONS) -> evdev button
+    EV_BUTTONS = {
+        1: ecodes.BTN_LEFT,
+        2: ecodes.BTN_MIDDLE,
+        3: ecodes.BTN_RIGHT,
+    } if UInput else {}
+    # X keysym names whose evdev KEY_* name isn't just the upper-cased keysym
+    KEY_ALIASES = {
+        'Return': 'KEY_ENTER', 'BackSpace': 'KEY_BACKSPACE', 'Escape': 'KEY_ESC',
+        'Prior': 'KEY_PAGEUP', 'Next': 'KEY_PAGEDOWN', 'Page_Up': 'KEY_PAGEUP',
+        'Page_Down': 'KEY_PAGEDOWN', 'Caps_Lock': 'KEY_CAPSLOCK', 'period': 'KEY_DOT',
+        'bracketleft': 'KEY_LEFTBRACE', 'bracketright': 'KEY_RIGHTBRACE',
+        'Control_L': 'KEY_LEFTCTRL', 'Control_R': 'KEY_RIGHTCTRL', 'ctrl': 'KEY_LEFTCTRL',
+        'Shift_L': 'KEY_LEFTSHIFT', 'Shift_R': 'KEY_RIGHTSHIFT', 'shift': 'KEY_LEFTSHIFT',
+        'Alt_L': 'KEY_LEFTALT', 'Alt_R': 'KEY_RIGHTALT', 'alt': 'KEY_LEFTALT',
+        'Super_L': 'KEY_LEFTMETA', 'Super_R': 'KEY_RIGHTMETA', 'super': 'KEY_LEFTMETA',
+    }
+
+    def __init__(self, display=DISPLAY_ENV, backend=INPUT_BACKEND):
+        self.display = display
+        self.mouse = None
+        self.kbd = None
+        self.pending_move = None  # newest queued (x, y) not yet injected
+        self.move_timer = None    # scheduled flush_move, if any
+        self.last_move = 0.0      # loop time of the last injected move
+        if backend != 'uinput':
+            return
+        if UInput is None:
+            logging.info("evdev not installed, injecting input via XTest")
+            return
+        try:
+            screen = get_xdisplay(display).screen()
+            w, h = screen.width_in_pixels, screen.height_in_pixels
+            self.mouse = UInput({
+                ecodes.EV_KEY: list(self.EV_BUTTONS.values()),
+                ecodes.EV_ABS: [
+                    (ecodes.ABS_X, AbsInfo(value=0, min=0, max=w - 1, fuzz=0, flat=0, resolution=0)),
+                    (ecodes.ABS_Y, AbsInfo(value=0, min=0, max=h - 1, fuzz=0, flat=0, resolution=0)),
+                ],
+            }, name='rpi-server-pointer')
+            self.kbd = UInput({
+                ecodes.EV_KEY: list(range(ecodes.KEY_ESC, ecodes.KEY_MICMUTE + 1)),
+            }, name='rpi-server-keyboard')
+        except Exception as e:
+            logging.warning("uinput unavailable (%s), injecting input via XTest", e)
+            self.close()
+
+    def keycode(self, key):
+        key = str(key)
+        return ecodes.ecodes.get(self.KEY_ALIASES.get(key, 'KEY_' + key.upper()))
+
+    def queue_move(self, x, y):
+        """
+        Throttle pointer moves: only the newest position matters, so it is injected at
+        most once per MOVE_INTERVAL, however fast the browser sends mousemove events.
+        """
+        self.pending_move = (x, y)
+        if self.move_timer is None:
+            loop = asyncio.get_running_loop()
+            delay = max(0.0, self.last_move + MOVE_INTERVAL - loop.time())
+            self.move_timer = loop.call_later(delay, self.flush_move)
+
+    def flush_move(self):
+        self.move_timer = None
+        if self.pending_move is None:
+            return
+        x, y = self.pending_move
+        self.pending_move = None
+        self.last_move = asyncio.get_running_loop().time()
+        self.mouse_move(x, y)
+
+    def mouse_move(self, x, y):
+        if self.mouse is None:
+            inject_mouse_move(x, y, display=self.display)
+            return
+        try:
+            self.mouse.write(ecodes.EV_ABS, ecodes.ABS_X, x)
+            self.mouse.write(ecodes.EV_ABS, ecodes.ABS_Y, y)
+            self.mouse.syn()
+        except Exception as e:
+            logging.exception("mouse_move failed: %s", e)
+
+    def mouse_abs(self, x, y, button='left', pressed=True):
+        # a click carries its own position, so any queued move is stale
+        self.pending_move = None
+        if self.mouse is None:
+            inject_mouse_abs(x, y, button, pressed, display=self.display)
+            return
+        try:
+            self.mouse.write(ecodes.EV_ABS, ecodes.ABS_X, x)
+            self.mouse.write(ecodes.EV_ABS, ecodes.ABS_Y, y)
+            self.mouse.write(ecodes.EV_KEY, self.EV_BUTTONS[BUTTONS.get(button, 3)], 1 if pressed else 0)
+            self.mouse.syn()
+        except Exception as e:
+            logging.exception("mouse_abs failed: %s", e)
+
+    def key(self, key, pressed=True):
+        code = self.keycode(key) if self.kbd is not None else None
+        found = None
+        if code is not None:
+            try:
+                found = resolve_key(get_xdisplay(self.display), key)
+            except Exception:
+                pass
+        if found is None:
+            # no evdev code, or we can't tell whether the keysym needs Shift
+            inject_key(key, pressed, display=self.display)
+            return
+        try:
+            if pressed and found[1] == 1:
+                # shifted keysym ("A"): Shift around the key in the same report, as on XTest
+                self.kbd.write(ecodes.EV_KEY, ecodes.KEY_LEFTSHIFT, 1)
+                self.kbd.write(ecodes.EV_KEY, code, 1)
+                self.kbd.write(ecodes.EV_KEY, ecodes.KEY_LEFTSHIFT, 0)
+            else:
+                self.kbd.write(ecodes.EV_KEY, code, 1 if pressed else 0)
+            self.kbd.syn()
+        except Exception as e:
+            logging.exception("key failed: %s", e)
+
+    def close(self):
+        if self.move_timer is not None:
+            self.move_timer.cancel()
+            self.move_timer = None
+        for ui in (self.mouse, self.kbd):
+            if ui is not None:
+                ui.close()
+        self.mouse = self.kbd = None
+
+def draw_cursor(arr, cx, cy, r):
+    """Stamp a white dot with a black rim at (cx, cy) directly into a BGRA array."""
+    h, w = arr.shape[:2]
+    y0, y1 = max(cy - r - 1, 0), min(cy + r + 2, h)
+    x0, x1 = max(cx - r - 1, 0), min(cx + r + 2, w)
+    if y0 >= y1 or x0 >= x1:
+        return
+    yy, xx = np.ogrid[y0:y1, x0:x1]
+    d2 = (yy - cy) ** 2 + (xx - cx) ** 2
+    win = arr[y0:y1, x0:x1]
+    win[d2 <= (r + 1) ** 2] = (0, 0, 0, 255)
+    win[d2 <= r * r] = (255, 255, 255, 255)
+
 # ------------- Video Track ----------------
+def pin_capture_thread():
+    """Executor initializer: keep the capture thread on its own cores at a raised priority."""
+    # both calls act on the calling thread only when given 0 on Linux
+    try:
+        cpus = CAPTURE_CPUS & os.sched_getaffinity(0)
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+    except (AttributeError, OSError) as e:
+        logging.debug("capture affinity not set: %s", e)
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, CAPTURE_NICE)
+    except (AttributeError, OSError) as e:
+        logging.debug("capture priority not raised: %s", e)
+
 class ScreenTrack(VideoStreamTrack):
     """
     A VideoStreamTrack that captures the desktop using mss and yields VideoFrame objects.
-    We overlay a simple cursor for demo purposes using PIL.
+    We overlay a simple cursor for demo purposes straight into the captured buffer.
     """
     def __init__(self, display=DISPLAY_ENV, fps=15, scale=1.0):
         super().__init__()  # don't forget
-        self.sct = mss.mss()
-        self.monitor = self.sct.monitors[1]
+        self.display = display
         self.fps = fps
         self.frame_time = 1.0 / fps
         self.scale = scale
         self._last_ts = None
+        # (content hash, cursor position) of the last frame and its final array
+        self._last_key = None
+        self._last_arr = None
+        self.small = None  # preallocated scaled-down BGRA frame
+        self.sct = None
+        self.xdisplay = None
+        # one dedicated thread: mss and the Xlib connection are opened and used only from it
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='capture',
+                                           initializer=pin_capture_thread)
 
-    async def recv(self):
-        # adhere to required timing
-        pts, time_base = await self.next_timestamp()
-        # grab screen
+    async def start(self):
+        """Open the capture sources on the capture thread; must be awaited before use."""
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self.open_sources)
+        except Exception:
+            # e.g. Display() failed after mss had already connected
+            self.executor.submit(self.close_sources)
+            self.executor.shutdown(wait=False)
+            raise
+
+    def open_sources(self):
+        self.sct = mss.mss()
+        self.monitor = self.sct.monitors[1]
+        # separate from the injection connection: Xlib connections are not shared across users
+        self.xdisplay = Display(self.display)
+
+    def close_sources(self):
+        """Release both X clients; mss' handle must be closed on the thread that opened it."""
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
+        if self.xdisplay is not None:
+            self.xdisplay.close()
+            self.xdisplay = None
+
+    def grab(self):
+        """Capture one frame as an (h, w, 4) uint8 BGRA array."""
+        # wrap mss' native BGRA buffer without repacking it (a fresh buffer per grab)
         img = self.sct.grab(self.monitor)
-        pil = Image.frombytes('RGB', img.size, img.rgb)
-        # optionally scale down to reduce bandwidth
-        if self.scale != 1.0:
-            w = int(pil.width * self.scale)
-            h = int(pil.height * self.scale)
-            pil = pil.resize((w, h), Image.LANCZOS)
-
-        # overlay cursor: get x,y via xdotool
+        return np.frombuffer(img.raw, dtype=np.uint8).reshape(img.height, img.width, 4)
+
+    def capture_frame(self):
+        """Grab, overlay the cursor, scale and convert; returns an I420 (yuv420p) array."""
+        # grab screen
+        arr = self.grab()
+        height, width = arr.shape[:2]
+
+        # cursor position, queried over our own X connection
+        cursor = None
         try:
-            env = dict(os.environ); env['DISPLAY'] = DISPLAY_ENV
-            out = subprocess.check_output(['xdotool', 'getmouselocation', '--shell'], env=env, text=True)
-            m = re.search(r'X=(\d+)', out)
-            n = re.search(r'Y=(\d+)', out)
-            if m and n:
-                cx = int(m.group(1))
-                cy = int(n.group(1))
-                # adjust for scaling
-                if self.scale != 1.0:
-                    cx = int(cx * self.scale)
-                    cy = int(cy * self.scale)
-                draw = ImageDraw.Draw(pil)
-                # simple cursor marker (white circle with black border)
-                r = max(2, int(pil.width * 0.01))  # radius relative to size
-                draw.ellipse((cx-r, cy-r, cx+r, cy+r), fill=(255,255,255))
-                draw.ellipse((cx-r-1, cy-r-1, cx+r+1, cy+r+1), outline=(0,0,0))
+            pointer = self.xdisplay.screen().root.query_pointer()
+            cursor = (pointer.root_x, pointer.root_y)
         except Exception:
             pass
 
-        # convert to VideoFrame
-        frame = VideoFrame.from_image(pil)
+        # static desktop: same pixels, same cursor -> reuse the last processed frame
+        key = (xxhash.xxh3_64_intdigest(arr), cursor)
+        if key == self._last_key:
+            arr = self._last_arr
+        else:
+            # overlay cursor
+            if cursor is not None:
+                # simple cursor marker (white circle with black border)
+                r = max(2, int(width * 0.01))  # radius relative to size
+                draw_cursor(arr, cursor[0], cursor[1], r)
+
+            # optionally scale down to reduce bandwidth. 4:2:0 needs an even width; the
+            # height must be a multiple of 4 because from_numpy_buffer derives it from the
+            # I420 array as rows // 6 * 4, so 2 mod 4 would lose rows and shift the chroma
+            if self.scale != 1.0:
+                w = int(width * self.scale) & ~1
+                h = int(height * self.scale) & ~3
+                # resize into a buffer reused across ticks; cvtColor below copies out of it
+                if self.small is None or self.small.shape[:2] != (h, w):
+                    self.small = np.empty((h, w, 4), dtype=np.uint8)
+                arr = cv2.resize(arr, (w, h), dst=self.small, interpolation=cv2.INTER_AREA)
+            else:
+                arr = arr[:height & ~3, :width & ~1]
+
+            # convert to planar 4:2:0 once here, rather than in every peer's encoder:
+            # a quarter of the chroma samples and 1.5 bytes/px instead of 4
+            arr = cv2.cvtColor(arr, cv2.COLOR_BGRA2YUV_I420)
+            self._last_key, self._last_arr = key, arr
+        return arr
+
+    async def recv(self):
+        # adhere to required timing
+        pts, time_base = await self.next_timestamp()
+        # stopped while waiting for the tick (last peer gone, shutdown): end the relay cleanly
+        if self.readyState != 'live':
+            raise MediaStreamError
+        # capture off the event loop so signalling, DTLS/SCTP and input handling never stall
+        # behind a grab; the C code underneath (XGetImage, xxhash, resize) releases the GIL
+        loop = asyncio.get_running_loop()
+        try:
+            yuv = await loop.run_in_executor(self.executor, self.capture_frame)
+        except RuntimeError:
+            # executor shut down by stop() in the meantime
+            if self.readyState != 'live':
+                raise MediaStreamError
+            raise
+
+        # wrap as a VideoFrame without copying; already yuv420p, so encoders skip their reformat.
+        # A fresh wrapper per tick, since relayed peers may still hold the previous one
+        frame = VideoFrame.from_numpy_buffer(yuv, format='yuv420p')
         frame.pts = pts
         frame.time_base = time_base
         return frame
 
+    def stop(self):
+        super().stop()
+        # queued behind any in-flight capture on the same thread; the track is rebuilt per
+        # viewer session, so leaving these open would leak X clients until the server's limit
+        try:
+            self.executor.submit(self.close_sources)
+        except RuntimeError:
+            pass  # already shut down (start() failed)
+        self.executor.shutdown(wait=False)
+
+def prefer_codec(pc, sender, preferred_codec):
+    """
+    Put `preferred_codec` (e.g. "video/H264") first in the sender's transceiver preferences,
+    keeping the other codecs as fallbacks for offers that don't include it.
+    """
+    kind = preferred_codec.split("/")[0]
+    codecs = RTCRtpSender.getCapabilities(kind).codecs
+    transceiver = next(t for t in pc.getTransceivers() if t.sender == sender)
+    # MIME types are case-insensitive
+    preferred = preferred_codec.lower()
+    transceiver.setCodecPreferences(
+        [c for c in codecs if c.mimeType.lower() == preferred]
+        + [c for c in codecs if c.mimeType.lower() != preferred])
+
 # ------------- Web handlers ----------------
+async def close_pc(pc):
+    """Close a peer and stop the shared capture once nobody is watching."""
+    global screen
+    await pc.close()
+    pcs.discard(pc)
+    if not pcs and screen is not None:
+        screen.stop()
+        screen = None
+
 @aiohttp_jinja2.template('client.html')
 async def index(request):
     return {}
 
 async def offer(request):
+    global screen, injector
     params = await request.json()
     offer = RTCSessionDescription(sdp=params['sdp'], type=params['type'])
 
@@ -136,9 +473,11 @@ async def offer(request):
     pcs.add(pc)
     logging.info("Created PC %s", pc)
 
-    # prepare track and advertise width/height to client via DataChannel after negotiation
-    screen = ScreenTrack()
-    pc.addTrack(screen)
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        logging.info("PC %s connection state is %s", pc, pc.connectionState)
+        if pc.connectionState in ('failed', 'closed'):
+            await close_pc(pc)
 
     # DataChannel handling
     @pc.on("datachannel")
@@ -149,10 +488,8 @@ async def offer(request):
         def on_message(message):
             # expect JSON messages like {"type":"mouse_abs","x":100,"y":200,"button":"left","pressed":true}
             try:
-                if isinstance(message, str):
-                    obj = json.loads(message)
-                else:
-                    obj = json.loads(message.decode('utf8'))
+                # orjson takes str and UTF-8 bytes alike, no need to decode a copy first
+                obj = orjson.loads(message)
             except Exception:
                 logging.warning("Invalid DC message")
                 return
@@ -161,18 +498,39 @@ async def offer(request):
                 x = int(obj.get('x',0)); y = int(obj.get('y',0))
                 button = obj.get('button','left'); pressed = obj.get('pressed', True)
                 logging.debug("Inject mouse_abs %s,%s %s %s", x, y, button, pressed)
-                inject_mouse_abs(x, y, button, pressed, display=DISPLAY_ENV)
+                injector.mouse_abs(x, y, button, pressed)
+            elif typ == 'mouse_move':
+                injector.queue_move(int(obj.get('x',0)), int(obj.get('y',0)))
             elif typ == 'key':
                 key = obj.get('key'); pressed = obj.get('pressed', True)
-                inject_key(key, pressed, display=DISPLAY_ENV)
+                injector.key(key, pressed)
             else:
                 logging.debug("DC unknown type %s", typ)
 
-    # set remote description
-    await pc.setRemoteDescription(offer)
-    # create answer
-    answer = await pc.createAnswer()
-    await pc.setLocalDescription(answer)
+    try:
+        # prepare track and advertise width/height to client via DataChannel after negotiation
+        if injector is None:
+            injector = InputInjector(DISPLAY_ENV, INPUT_BACKEND)
+        if screen is None or screen.readyState == 'ended':
+            screen = ScreenTrack(display=DISPLAY_ENV)
+            try:
+                await screen.start()
+            except Exception:
+                screen = None
+                raise
+        # unbuffered: a peer whose encoder falls behind gets the newest frame, not a backlog
+        sender = pc.addTrack(relay.subscribe(screen, buffered=False))
+        if VIDEO_CODEC:
+            prefer_codec(pc, sender, VIDEO_CODEC)
+
+        # set remote description
+        await pc.setRemoteDescription(offer)
+        # create answer
+        answer = await pc.createAnswer()
+        await pc.setLocalDescription(answer)
+    except Exception:
+        await close_pc(pc)
+        raise
 
     return web.json_response({'sdp': pc.localDescription.sdp, 'type': pc.localDescription.type})
 
@@ -180,6 +538,10 @@ async def on_shutdown(app):
     coros = [pc.close() for pc in pcs]
     await asyncio.gather(*coros)
     pcs.clear()
+    if screen is not None:
+        screen.stop()
+    if injector is not None:
+        injector.close()
 
 # routes
 app.router.add_get('/', index)
@@ -193,7 +555,22 @@ if __name__ == '__main__':
     parser.add_argument('--host', default=LISTEN_HOST)
     parser.add_argument('--port', type=int, default=LISTEN_PORT)
     parser.add_argument('--display', default=DISPLAY_ENV)
+    parser.add_argument('--input', choices=('xtest', 'uinput'), default=INPUT_BACKEND,
+                        help='input injection: XTest into --display, or uinput devices (physical console only)')
+    parser.add_argument('--codec', default=VIDEO_CODEC,
+                        help='video codec to prefer, e.g. video/H264 (software libx264) or video/VP8; '
+                             'others stay as fallbacks (default: negotiate)')
     args = parser.parse_args()
     DISPLAY_ENV = args.display
+    INPUT_BACKEND = args.input
+    if args.codec:
+        # reject typos at startup instead of failing every /offer; normalise the case
+        video_codecs = {c.mimeType.lower(): c.mimeType
+                        for c in RTCRtpSender.getCapabilities('video').codecs
+                        if c.mimeType.lower() != 'video/rtx'}
+        if args.codec.lower() not in video_codecs:
+            parser.error("--codec must be one of: %s" % ", ".join(sorted(video_codecs.values())))
+        args.codec = video_codecs[args.codec.lower()]
+    VIDEO_CODEC = args.codec
     logging.info("Starting server on %s:%d (DISPLAY=%s)", args.host, args.port, DISPLAY_ENV)
     web.run_app(app, host=args.host, port=args.port)